@@ -18,6 +18,7 @@ from __future__ import annotations
 
 import configparser
 import logging
+import threading
 from pathlib import Path
 from typing import Any, Callable
 
@@ -65,8 +66,9 @@ def _resolve_endpoint() -> str:
     return _DEFAULT_ENDPOINT
 
 
-# Module-level singleton
+# Module-level singleton; _init_lock guards creation and teardown
 _instance: HiveBoard | None = None
+_init_lock = threading.Lock()
 
 
 class HiveBoard:
@@ -113,17 +115,26 @@ class HiveBoard:
         stuck_threshold: int = 300,
         heartbeat_payload: Callable[[], dict[str, Any] | None] | None = None,
         queue_provider: Callable[[], dict[str, Any] | None] | None = None,
+        track_nesting: bool = True,
+        action_sample_rate: float = 1.0,
     ) -> Agent:
         """Create or retrieve an agent.
 
         Idempotent: same agent_id returns existing instance (updates metadata).
+        Pass track_nesting=False to skip parent/child action linkage for
+        agents that never nest tracked actions. action_sample_rate below 1.0
+        records only that fraction of @agent.track calls.
         """
-        if agent_id in self._agents:
-            existing = self._agents[agent_id]
-            # Update metadata if different
-            existing.agent_type = type
-            existing.version = version
-            existing.framework = framework
+        existing = self._agents.get(agent_id)
+        if existing is not None:
+            # Update metadata only if different
+            if (existing.agent_type, existing.version, existing.framework) != (
+                type, version, framework,
+            ):
+                existing.agent_type = type
+                existing.version = version
+                existing.framework = framework
+                existing._refresh_envelope()
             existing._heartbeat_payload_cb = heartbeat_payload
             existing._queue_provider_cb = queue_provider
             return existing
@@ -140,6 +151,8 @@ class HiveBoard:
             queue_provider=queue_provider,
             environment=self._environment,
             group=self._group,
+            track_nesting=track_nesting,
+            action_sample_rate=action_sample_rate,
         )
         self._agents[agent_id] = ag
         ag._register()
@@ -182,42 +195,50 @@ def init(
             f"Invalid API key format: must start with 'hb_' (got '{api_key[:10]}...')"
         )
 
-    if _instance is not None:
-        logger.warning(
-            "hiveloop.init() called again — returning existing instance. "
-            "Call hiveloop.reset() first to reinitialize."
-        )
-        return _instance
-
-    _instance = HiveBoard(
-        api_key=api_key,
-        endpoint=endpoint,
-        environment=environment,
-        group=group,
-        flush_interval=flush_interval,
-        batch_size=batch_size,
-        max_queue_size=max_queue_size,
-        debug=debug,
+    # Fast path without the lock; re-checked below before constructing
+    instance = _instance
+    if instance is None:
+        with _init_lock:
+            instance = _instance
+            if instance is None:
+                _instance = HiveBoard(
+                    api_key=api_key,
+                    endpoint=endpoint,
+                    environment=environment,
+                    group=group,
+                    flush_interval=flush_interval,
+                    batch_size=batch_size,
+                    max_queue_size=max_queue_size,
+                    debug=debug,
+                )
+                return _instance
+
+    logger.warning(
+        "hiveloop.init() called again — returning existing instance. "
+        "Call hiveloop.reset() first to reinitialize."
     )
-    return _instance
+    return instance
 
 
 def shutdown(timeout: float = 5.0) -> None:
     """Shut down the HiveLoop SDK."""
-    global _instance
-    if _instance is not None:
-        _instance.shutdown(timeout=timeout)
+    instance = _instance
+    if instance is not None:
+        instance.shutdown(timeout=timeout)
 
 
 def reset() -> None:
     """Shut down and clear the singleton. Allows re-initialization."""
     global _instance
-    if _instance is not None:
-        _instance.shutdown(timeout=5.0)
+    with _init_lock:
+        instance = _instance
         _instance = None
+    if instance is not None:
+        instance.shutdown(timeout=5.0)
 
 
 def flush() -> None:
     """Flush all queued events immediately."""
-    if _instance is not None:
-        _instance.flush()
+    instance = _instance
+    if instance is not None:
+        instance.flush()
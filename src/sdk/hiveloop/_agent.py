@@ -11,14 +11,19 @@ from __future__ import annotations
 import asyncio
 import contextvars
 import functools
+import heapq
 import inspect
+import itertools
+import json
 import logging
+import os
 import platform
+import random
+import secrets
 import threading
 import time
-import uuid
+import weakref
 from contextlib import contextmanager
-from datetime import datetime, timezone
 from typing import TYPE_CHECKING, Any, Callable
 
 from shared.enums import (
@@ -32,6 +37,30 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger("hiveloop.agent")
 
+# Event types and payload kinds used below, bound once as plain strings:
+# enum member lookups are far slower than module globals on the emit path,
+# and the values serialize identically
+_ET_ACTION_COMPLETED = EventType.ACTION_COMPLETED.value
+_ET_ACTION_FAILED = EventType.ACTION_FAILED.value
+_ET_ACTION_STARTED = EventType.ACTION_STARTED.value
+_ET_AGENT_REGISTERED = EventType.AGENT_REGISTERED.value
+_ET_APPROVAL_RECEIVED = EventType.APPROVAL_RECEIVED.value
+_ET_APPROVAL_REQUESTED = EventType.APPROVAL_REQUESTED.value
+_ET_CUSTOM = EventType.CUSTOM.value
+_ET_ESCALATED = EventType.ESCALATED.value
+_ET_HEARTBEAT = EventType.HEARTBEAT.value
+_ET_RETRY_STARTED = EventType.RETRY_STARTED.value
+_ET_TASK_COMPLETED = EventType.TASK_COMPLETED.value
+_ET_TASK_FAILED = EventType.TASK_FAILED.value
+_ET_TASK_STARTED = EventType.TASK_STARTED.value
+_PK_ISSUE = PayloadKind.ISSUE.value
+_PK_LLM_CALL = PayloadKind.LLM_CALL.value
+_PK_PLAN_CREATED = PayloadKind.PLAN_CREATED.value
+_PK_PLAN_STEP = PayloadKind.PLAN_STEP.value
+_PK_QUEUE_SNAPSHOT = PayloadKind.QUEUE_SNAPSHOT.value
+_PK_SCHEDULED = PayloadKind.SCHEDULED.value
+_PK_TODO = PayloadKind.TODO.value
+
 # ContextVar for action nesting (works across threads and async)
 _current_action_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
     "_current_action_id", default=None
@@ -40,22 +69,67 @@ _current_action_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
 # SDK version constant
 SDK_VERSION = "hiveloop-0.1.0"
 
+# Envelope runtime string; the interpreter version can't change at runtime
+_PYTHON_RUNTIME = f"python-{platform.python_version()}"
+
 
 def _utcnow_iso() -> str:
-    """UTC timestamp in ISO 8601 format."""
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    """UTC timestamp in ISO 8601 format, millisecond precision."""
+    seconds, ns = divmod(time.time_ns(), 1_000_000_000)
+    t = time.gmtime(seconds)
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (
+        t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
+        ns // 1_000_000,
+    )
+
+
+def _make_id_prefix() -> str:
+    """Random per-process prefix laid out as the first 80 bits of a UUIDv8."""
+    n = secrets.token_hex(10)
+    variant = "89ab"[int(n[15], 16) & 3]
+    return f"{n[0:8]}-{n[8:12]}-8{n[12:15]}-{variant}{n[16:19]}-"
+
+
+_id_prefix = _make_id_prefix()
+_id_counter = itertools.count()
+
+
+def _reseed_ids() -> None:
+    """Give a forked child its own id space."""
+    global _id_prefix, _id_counter
+    _id_prefix = _make_id_prefix()
+    _id_counter = itertools.count()
+
+
+os.register_at_fork(after_in_child=_reseed_ids)
 
 
 def _new_id() -> str:
-    """Generate a new UUID4 string."""
-    return str(uuid.uuid4())
+    """Generate a new UUID-formatted id (random process prefix + counter).
 
+    These ids only need to be unique, not unguessable, so this avoids a
+    urandom read and UUID object per call.
+    """
+    return f"{_id_prefix}{next(_id_counter) & 0xFFFFFFFFFFFF:012x}"
 
-def _strip_none(d: dict[str, Any]) -> dict[str, Any]:
-    """Remove None values from a dict, but always keep event_id, timestamp, event_type."""
-    keep_always = {"event_id", "timestamp", "event_type"}
-    return {k: v for k, v in d.items() if v is not None or k in keep_always}
 
+# Terminal failures are never evicted from a full queue and are flushed
+# right away, so error status reaches the dashboard promptly
+_CRITICAL_EVENT_TYPES = frozenset({_ET_TASK_FAILED, _ET_ACTION_FAILED})
+
+# Longest gap between heartbeats when they are skipped for busy agents.
+# The dashboard treats a heartbeat as fresh below 60s; 45s leaves room for
+# the transport's flush interval (5s by default) on top.
+_HEARTBEAT_MAX_SILENCE = 45.0
+
+# Severity auto-defaults as plain strings, resolved once at import
+_SEVERITY_DEFAULTS: dict[str, str] = {
+    str(et): sev.value for et, sev in SEVERITY_DEFAULTS.items()
+}
+_SEVERITY_INFO = Severity.INFO.value
+
+# Base fields for events emitted outside a task; shared, never mutated
+_NO_TASK_FIELDS: dict[str, Any] = {}
 
 # Field size limits for client-side validation
 _FIELD_LIMITS: dict[str, int] = {
@@ -88,17 +162,113 @@ def _validate_field_sizes(event: dict[str, Any]) -> None:
             )
             payload["summary"] = summary[:MAX_SUMMARY_CHARS]
 
-        # Check total payload size
-        import json as _json
-        try:
-            payload_bytes = len(_json.dumps(payload))
-            if payload_bytes > MAX_PAYLOAD_BYTES:
-                logger.warning(
-                    "payload exceeds max size (%d > %d bytes), event may be rejected",
-                    payload_bytes, MAX_PAYLOAD_BYTES,
+
+def _encode_event(event: dict[str, Any]) -> bytes | None:
+    """Serialize an event for the transport. Returns None (and logs) if it can't be.
+
+    Also checks the payload size limit. The ingest endpoint measures
+    json.dumps(payload) with default separators, which is at most twice the
+    compact encoding, so the payload is only measured on its own when the
+    whole encoded event is over half the limit.
+    """
+    try:
+        data = json.dumps(event, separators=(",", ":"), allow_nan=False).encode("utf-8")
+    except (TypeError, ValueError):
+        logger.warning(
+            "Event %s is not JSON-serializable, dropping it",
+            event.get("event_type"),
+            exc_info=True,
+        )
+        return None
+
+    if 2 * len(data) > MAX_PAYLOAD_BYTES and event.get("payload") is not None:
+        payload_bytes = len(json.dumps(event["payload"]))
+        if payload_bytes > MAX_PAYLOAD_BYTES:
+            logger.warning(
+                "payload exceeds max size (%d > %d bytes), event may be rejected",
+                payload_bytes, MAX_PAYLOAD_BYTES,
+            )
+    return data
+
+
+class _HeartbeatScheduler:
+    """Single background thread that drives heartbeats for every agent.
+
+    Agents sit in a min-heap keyed by their next due time. The thread is
+    started on the first registration and exits once no agents remain.
+    Agents are held weakly, so an agent that is dropped without being
+    unregistered does not keep the thread alive. Unregistered or collected
+    entries are dropped lazily when they reach the heap top.
+    """
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        """Start from an empty schedule with no thread.
+
+        Also run in a forked child: the parent's thread does not exist
+        there (and its lock may be held), so, as with per-agent threads,
+        inherited agents stop heartbeating and new ones start a fresh thread.
+        """
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, weakref.ref[Agent]]] = []
+        self._live: weakref.WeakKeyDictionary[Agent, int] = weakref.WeakKeyDictionary()
+        self._seq = itertools.count()
+        self._thread: threading.Thread | None = None
+
+    def register(self, agent: Agent) -> None:
+        """Schedule heartbeats for an agent, first one after its interval."""
+        with self._cond:
+            seq = next(self._seq)
+            self._live[agent] = seq
+            due = time.monotonic() + agent._heartbeat_interval
+            heapq.heappush(self._heap, (due, seq, weakref.ref(agent)))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="hiveloop-heartbeat", daemon=True
                 )
-        except (TypeError, ValueError):
-            pass
+                self._thread.start()
+            self._cond.notify()
+
+    def unregister(self, agent: Agent) -> None:
+        """Stop heartbeats for an agent. No-op if it is not registered."""
+        with self._cond:
+            if self._live.pop(agent, None) is not None:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        """Scheduler thread loop."""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._live:
+                        self._heap.clear()
+                        self._thread = None
+                        return
+                    due, seq, ref = self._heap[0]
+                    agent = ref()
+                    if agent is None or self._live.get(agent) != seq:
+                        heapq.heappop(self._heap)
+                        continue
+                    delay = due - time.monotonic()
+                    if delay <= 0:
+                        break
+                    # Don't hold the agent alive while sleeping
+                    agent = None
+                    self._cond.wait(timeout=delay)
+                # Reschedule before emitting; never try to catch up on missed beats
+                heapq.heappop(self._heap)
+                next_due = max(due + agent._heartbeat_interval, time.monotonic())
+                heapq.heappush(self._heap, (next_due, seq, ref))
+            try:
+                agent._heartbeat_due()
+            except Exception:
+                logger.debug("Heartbeat failed for agent %s", agent.agent_id, exc_info=True)
+
+
+_HB_SCHEDULER = _HeartbeatScheduler()
+os.register_at_fork(after_in_child=_HB_SCHEDULER._reset)
 
 
 class HiveLoopError(Exception):
@@ -111,6 +281,12 @@ class Task:
     Can be used as a context manager or manually via start_task/complete/fail.
     """
 
+    __slots__ = (
+        "_agent", "task_id", "project_id", "task_type", "task_run_id",
+        "correlation_id", "_start_ns", "_completed", "_payload",
+        "_plan_total_steps", "_plan_revision", "_active_token", "_task_fields",
+    )
+
     def __init__(
         self,
         agent: Agent,
@@ -126,9 +302,21 @@ class Task:
         self.task_type = task_type
         self.task_run_id = task_run_id or _new_id()
         self.correlation_id = correlation_id
-        self._start_time: float | None = None
+        # Identity fields carried by every event of this task (and of actions
+        # run under it), None values dropped; snapshotted here
+        self._task_fields: dict[str, Any] = {
+            k: v for k, v in (
+                ("task_id", task_id),
+                ("project_id", project_id),
+                ("task_type", task_type),
+                ("task_run_id", self.task_run_id),
+                ("correlation_id", correlation_id),
+            ) if v is not None
+        }
+        self._start_ns: int | None = None
         self._completed = False
         self._payload: dict[str, Any] | None = None
+        self._active_token: contextvars.Token | None = None
         # Plan state tracking (C1.4)
         self._plan_total_steps: int | None = None
         self._plan_revision: int = 0
@@ -151,16 +339,12 @@ class Task:
 
     def _start(self) -> None:
         """Emit task_started and set as active task."""
-        self._start_time = time.monotonic()
-        # Set as active task on thread-local
-        self._agent._set_active_task(self)
-        self._agent._emit_event(
-            event_type=EventType.TASK_STARTED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._start_ns = time.monotonic_ns()
+        # Set as active task in the current context
+        self._active_token = self._agent._set_active_task(self)
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_TASK_STARTED,
             payload={"summary": f"Task {self.task_id} started"},
         )
 
@@ -188,18 +372,14 @@ class Task:
         payload: dict[str, Any] = {"summary": f"Task {self.task_id} completed"}
         if self._payload:
             payload.update(self._payload)
-        self._agent._emit_event(
-            event_type=EventType.TASK_COMPLETED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_TASK_COMPLETED,
             status=status,
             duration_ms=duration_ms,
             payload=payload,
         )
-        self._agent._clear_active_task()
+        self._agent._clear_active_task(self._active_token)
 
     def _fail_internal(self, exception: BaseException | None = None) -> None:
         if self._completed:
@@ -212,23 +392,19 @@ class Task:
             payload["exception_message"] = str(exception)
         if self._payload:
             payload.update(self._payload)
-        self._agent._emit_event(
-            event_type=EventType.TASK_FAILED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_TASK_FAILED,
             status="failure",
             duration_ms=duration_ms,
             payload=payload,
         )
-        self._agent._clear_active_task()
+        self._agent._clear_active_task(self._active_token)
 
     def _duration_ms(self) -> int | None:
-        if self._start_time is None:
+        if self._start_ns is None:
             return None
-        return int((time.monotonic() - self._start_time) * 1000)
+        return (time.monotonic_ns() - self._start_ns) // 1_000_000
 
     # -- Task-scoped events --
 
@@ -240,13 +416,9 @@ class Task:
         parent_event_id: str | None = None,
     ) -> None:
         """Emit a task-scoped event."""
-        self._agent._emit_event(
+        self._agent._emit_event_with_base(
+            self._task_fields,
             event_type=event_type,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
             severity=severity,
             parent_event_id=parent_event_id,
             payload=payload,
@@ -286,20 +458,16 @@ class Task:
 
         summary = _build_llm_summary(name, model, tokens_in, tokens_out, cost)
         payload: dict[str, Any] = {
-            "kind": PayloadKind.LLM_CALL,
+            "kind": _PK_LLM_CALL,
             "summary": summary,
             "data": data,
             "tags": ["llm"],
         }
         # Inherit action context if inside a tracked function
         action_id = _current_action_id.get()
-        self._agent._emit_event(
-            event_type=EventType.CUSTOM,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_CUSTOM,
             action_id=action_id,
             payload=payload,
         )
@@ -316,18 +484,14 @@ class Task:
         self._plan_revision = revision
         step_data = [{"index": i, "description": s} for i, s in enumerate(steps)]
         payload: dict[str, Any] = {
-            "kind": PayloadKind.PLAN_CREATED,
+            "kind": _PK_PLAN_CREATED,
             "summary": goal,
             "data": {"goal": goal, "steps": step_data, "revision": revision},
             "tags": ["plan", "created"],
         }
-        self._agent._emit_event(
-            event_type=EventType.CUSTOM,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_CUSTOM,
             payload=payload,
         )
 
@@ -348,13 +512,9 @@ class Task:
         payload: dict[str, Any] = {"summary": summary}
         if data:
             payload["data"] = data
-        self._agent._emit_event(
-            event_type=EventType.ESCALATED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_ESCALATED,
             parent_event_id=parent_event_id,
             payload=payload,
         )
@@ -373,13 +533,9 @@ class Task:
         payload: dict[str, Any] = {"summary": summary}
         if data:
             payload["data"] = data
-        self._agent._emit_event(
-            event_type=EventType.APPROVAL_REQUESTED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_APPROVAL_REQUESTED,
             parent_event_id=parent_event_id,
             payload=payload,
         )
@@ -399,13 +555,9 @@ class Task:
         payload: dict[str, Any] = {"summary": summary}
         if data:
             payload["data"] = data
-        self._agent._emit_event(
-            event_type=EventType.APPROVAL_RECEIVED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_APPROVAL_RECEIVED,
             parent_event_id=parent_event_id,
             payload=payload,
         )
@@ -427,13 +579,9 @@ class Task:
         payload: dict[str, Any] = {"summary": summary}
         if data:
             payload["data"] = data
-        self._agent._emit_event(
-            event_type=EventType.RETRY_STARTED,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_RETRY_STARTED,
             parent_event_id=parent_event_id,
             payload=payload,
         )
@@ -450,6 +598,46 @@ class Task:
         plan_revision: int | None = None,
     ) -> None:
         """Record a plan step update for this task."""
+        payload = self._plan_step_payload(
+            step_index, action, summary,
+            total_steps=total_steps, turns=turns, tokens=tokens,
+            plan_revision=plan_revision,
+        )
+        self._agent._emit_event_with_base(
+            self._task_fields,
+            event_type=_ET_CUSTOM,
+            payload=payload,
+        )
+
+    def plan_steps_bulk(self, updates: list[tuple[int, str, str]]) -> None:
+        """Record several plan step updates at once.
+
+        Each update is a ``(step_index, action, summary)`` tuple. Emits the
+        same events as repeated plan_step() calls, but enqueues them in a
+        single transport operation.
+        """
+        self._agent._emit_events(
+            [
+                dict(
+                    event_type=_ET_CUSTOM,
+                    payload=self._plan_step_payload(step_index, action, summary),
+                )
+                for step_index, action, summary in updates
+            ],
+            base=self._task_fields,
+        )
+
+    def _plan_step_payload(
+        self,
+        step_index: int,
+        action: str,
+        summary: str,
+        *,
+        total_steps: int | None = None,
+        turns: int | None = None,
+        tokens: int | None = None,
+        plan_revision: int | None = None,
+    ) -> dict[str, Any]:
         ts = total_steps if total_steps is not None else self._plan_total_steps
         rev = plan_revision if plan_revision is not None else self._plan_revision
         data: dict[str, Any] = {
@@ -466,103 +654,51 @@ class Task:
 
         auto_summary = f"Step {step_index} {action}: {summary}"
         tags = ["plan", f"step_{action}"]
-        payload: dict[str, Any] = {
-            "kind": PayloadKind.PLAN_STEP,
+        return {
+            "kind": _PK_PLAN_STEP,
             "summary": auto_summary,
             "data": data,
             "tags": tags,
         }
-        self._agent._emit_event(
-            event_type=EventType.CUSTOM,
-            task_id=self.task_id,
-            project_id=self.project_id,
-            task_type=self.task_type,
-            task_run_id=self.task_run_id,
-            correlation_id=self.correlation_id,
-            payload=payload,
-        )
 
 
 class _ActionContext:
     """Context manager for inline action tracking via agent.track_context()."""
 
+    __slots__ = (
+        "_agent", "_action_name", "_action_id", "_parent_action_id", "_token",
+        "_start_ns", "_payload", "_task_fields",
+    )
+
     def __init__(self, agent: Agent, action_name: str) -> None:
         self._agent = agent
         self._action_name = action_name
-        self._action_id = _new_id()
+        self._action_id: str | None = None
         self._parent_action_id: str | None = None
         self._token: contextvars.Token | None = None
-        self._start_time: float = 0.0
+        self._start_ns = 0
         self._payload: dict[str, Any] | None = None
+        self._task_fields: dict[str, Any] = _NO_TASK_FIELDS
 
     def set_payload(self, payload: dict[str, Any]) -> None:
         """Set additional payload data for the action events."""
         self._payload = payload
 
     def __enter__(self) -> _ActionContext:
-        self._parent_action_id = _current_action_id.get()
-        self._token = _current_action_id.set(self._action_id)
-        self._start_time = time.monotonic()
-
-        task = self._agent._get_active_task()
-        event_payload: dict[str, Any] = {
-            "action_name": self._action_name,
-        }
-        self._agent._emit_event(
-            event_type=EventType.ACTION_STARTED,
-            action_id=self._action_id,
-            parent_action_id=self._parent_action_id,
-            task_id=task.task_id if task else None,
-            project_id=task.project_id if task else None,
-            task_type=task.task_type if task else None,
-            task_run_id=task.task_run_id if task else None,
-            correlation_id=task.correlation_id if task else None,
-            payload=event_payload,
-        )
+        (
+            self._action_id, self._parent_action_id, self._token, self._task_fields,
+        ) = self._agent._action_start({"action_name": self._action_name})
+        self._start_ns = time.monotonic_ns()
         return self
 
     def __exit__(self, exc_type: type | None, exc_val: BaseException | None, exc_tb: Any) -> bool:
-        duration_ms = int((time.monotonic() - self._start_time) * 1000)
-        task = self._agent._get_active_task()
-
-        if exc_val is not None:
-            event_payload: dict[str, Any] = {
-                "action_name": self._action_name,
-                "exception_type": type(exc_val).__name__,
-                "exception_message": str(exc_val),
-            }
-            if self._payload:
-                event_payload.update(self._payload)
-            self._agent._emit_event(
-                event_type=EventType.ACTION_FAILED,
-                action_id=self._action_id,
-                parent_action_id=self._parent_action_id,
-                task_id=task.task_id if task else None,
-                project_id=task.project_id if task else None,
-                task_type=task.task_type if task else None,
-                task_run_id=task.task_run_id if task else None,
-                correlation_id=task.correlation_id if task else None,
-                status="failure",
-                duration_ms=duration_ms,
-                payload=event_payload,
-            )
-        else:
-            event_payload = {"action_name": self._action_name}
-            if self._payload:
-                event_payload.update(self._payload)
-            self._agent._emit_event(
-                event_type=EventType.ACTION_COMPLETED,
-                action_id=self._action_id,
-                parent_action_id=self._parent_action_id,
-                task_id=task.task_id if task else None,
-                project_id=task.project_id if task else None,
-                task_type=task.task_type if task else None,
-                task_run_id=task.task_run_id if task else None,
-                correlation_id=task.correlation_id if task else None,
-                status="success",
-                duration_ms=duration_ms,
-                payload=event_payload,
-            )
+        event_payload: dict[str, Any] = {"action_name": self._action_name}
+        if self._payload:
+            event_payload.update(self._payload)
+        self._agent._action_end(
+            self._action_id, self._parent_action_id, event_payload,
+            self._task_fields, self._start_ns, exc_val,
+        )
 
         # Restore previous action context
         if self._token is not None:
@@ -573,6 +709,14 @@ class _ActionContext:
 class Agent:
     """An instrumented agent that emits telemetry events."""
 
+    __slots__ = (
+        "agent_id", "_transport", "agent_type", "version", "framework",
+        "_heartbeat_interval", "_stuck_threshold", "_heartbeat_payload_cb",
+        "_queue_provider_cb", "_environment", "_group", "_active_task",
+        "_envelope_json", "_track_nesting", "_action_sample_rate",
+        "_emit_count", "_hb_emit_count", "_last_hb", "__weakref__",
+    )
+
     def __init__(
         self,
         agent_id: str,
@@ -587,6 +731,8 @@ class Agent:
         queue_provider: Callable[[], dict[str, Any] | None] | None = None,
         environment: str = "production",
         group: str = "default",
+        track_nesting: bool = True,
+        action_sample_rate: float = 1.0,
     ) -> None:
         self.agent_id = agent_id
         self._transport = transport
@@ -599,22 +745,48 @@ class Agent:
         self._queue_provider_cb = queue_provider
         self._environment = environment
         self._group = group
+        # When False, actions skip the ContextVar bookkeeping that links
+        # nested actions (no parent_action_id, llm_call not attributed)
+        self._track_nesting = track_nesting
+        # Fraction of @track calls that emit action events; the rest run
+        # the wrapped function with no tracking at all
+        self._action_sample_rate = action_sample_rate
+
+        # Activity bookkeeping used to skip redundant heartbeats
+        self._emit_count = 0
+        self._hb_emit_count = 0
+        # No heartbeat sent yet, so the first one is never skipped
+        self._last_hb = float("-inf")
+
+        # Active task, scoped per thread and per asyncio task
+        self._active_task: contextvars.ContextVar[Task | None] = contextvars.ContextVar(
+            f"hiveloop_active_task_{agent_id}", default=None
+        )
 
-        # Thread-local for active task
-        self._task_local = threading.local()
+        # Batch envelope, shared by every event this agent emits
+        self._refresh_envelope()
 
-        # Heartbeat thread
-        self._hb_stop = threading.Event()
-        self._hb_thread: threading.Thread | None = None
+    def _refresh_envelope(self) -> None:
+        """Rebuild the cached envelope after agent metadata changes.
 
-    def _get_envelope(self) -> dict[str, Any]:
+        Only the JSON encoding is kept: the transport groups queued events
+        by it and splices it into each request body as-is. Agents that
+        heartbeat have the transport count their dropped events under it.
+        """
+        self._envelope_json = json.dumps(
+            self._build_envelope(), separators=(",", ":")
+        ).encode("utf-8")
+        if self._heartbeat_interval > 0:
+            self._transport.track_drops(self._envelope_json, self.agent_id)
+
+    def _build_envelope(self) -> dict[str, Any]:
         """Build the batch envelope for this agent."""
         return {
             "agent_id": self.agent_id,
             "agent_type": self.agent_type,
             "agent_version": self.version,
             "framework": self.framework,
-            "runtime": f"python-{platform.python_version()}",
+            "runtime": _PYTHON_RUNTIME,
             "sdk_version": SDK_VERSION,
             "environment": self._environment,
             "group": self._group,
@@ -625,7 +797,7 @@ class Agent:
     def _register(self) -> None:
         """Emit agent_registered event and start heartbeat."""
         self._emit_event(
-            event_type=EventType.AGENT_REGISTERED,
+            event_type=_ET_AGENT_REGISTERED,
             payload={
                 "summary": f"Agent {self.agent_id} registered",
                 "data": {
@@ -636,28 +808,51 @@ class Agent:
                 },
             },
         )
+        # Registration alone is not activity that makes a heartbeat redundant
+        self._hb_emit_count = self._emit_count
         self._start_heartbeat()
 
     # -- Heartbeat --
 
     def _start_heartbeat(self) -> None:
-        """Start the background heartbeat thread."""
+        """Register with the shared heartbeat scheduler."""
         if self._heartbeat_interval <= 0:
             return
-        self._hb_thread = threading.Thread(
-            target=self._heartbeat_loop,
-            name=f"hiveloop-hb-{self.agent_id}",
-            daemon=True,
-        )
-        self._hb_thread.start()
+        _HB_SCHEDULER.register(self)
 
-    def _heartbeat_loop(self) -> None:
-        """Heartbeat thread loop."""
-        while not self._hb_stop.wait(timeout=self._heartbeat_interval):
-            self._emit_heartbeat()
+    def _heartbeat_due(self) -> None:
+        """Scheduler tick: emit a heartbeat unless recent activity makes it redundant.
 
-    def _emit_heartbeat(self) -> None:
-        """Emit a heartbeat event, optionally with payload callback."""
+        An agent that emitted other events since the previous tick is
+        evidently alive, so the heartbeat is skipped — but only when no
+        heartbeat callbacks are configured (their data must keep flowing)
+        and skipping still leaves the gap to the *next* tick short enough for
+        the dashboard and stuck detection to consider the agent fresh. A
+        heartbeat that has dropped events to report is never skipped.
+        """
+        count = self._emit_count
+        active = count != self._hb_emit_count
+        self._hb_emit_count = count
+        dropped = self._transport.pop_dropped_count(self.agent_id)
+        if (
+            active
+            and not dropped
+            and self._heartbeat_payload_cb is None
+            and self._queue_provider_cb is None
+            and time.monotonic() + self._heartbeat_interval - self._last_hb
+            < min(_HEARTBEAT_MAX_SILENCE, self._stuck_threshold / 2)
+        ):
+            return
+        self._emit_heartbeat(dropped)
+        self._hb_emit_count = self._emit_count
+
+    def _emit_heartbeat(self, dropped: int = 0) -> None:
+        """Emit a heartbeat event, optionally with payload callback.
+
+        dropped is the number of this agent's events the transport had to
+        drop since the last heartbeat; reported as dropped_events.
+        """
+        self._last_hb = time.monotonic()
         payload: dict[str, Any] | None = None
 
         # Heartbeat payload callback
@@ -672,17 +867,22 @@ class Agent:
                 )
                 payload = None
 
-        self._emit_event(
-            event_type=EventType.HEARTBEAT,
-            payload=payload,
-        )
+        if dropped:
+            payload = {**(payload or {}), "dropped_events": dropped}
 
-        # Queue provider callback — emits separate queue_snapshot event
+        events: list[dict[str, Any]] = [
+            self._build_minimal_event(_ET_HEARTBEAT, payload),
+        ]
+
+        # Queue provider callback — adds a separate queue_snapshot event
         if self._queue_provider_cb:
             try:
                 queue_data = self._queue_provider_cb()
                 if queue_data is not None:
-                    self._emit_queue_snapshot_from_callback(queue_data)
+                    events.append(self._build_event({
+                        "event_type": _ET_CUSTOM,
+                        "payload": self._queue_snapshot_payload(queue_data),
+                    }))
             except Exception:
                 logger.warning(
                     "queue_provider callback failed for agent %s",
@@ -690,26 +890,33 @@ class Agent:
                     exc_info=True,
                 )
 
-    def _emit_queue_snapshot_from_callback(self, data: dict[str, Any]) -> None:
-        """Emit a queue_snapshot event from the queue_provider callback."""
+        # Both events are enqueued together in one transport operation
+        try:
+            self._transport.enqueue_many(
+                [data for data in map(_encode_event, events) if data is not None],
+                self._envelope_json,
+            )
+        except Exception:
+            logger.debug("Failed to emit heartbeat", exc_info=True)
+
+    @staticmethod
+    def _queue_snapshot_payload(data: dict[str, Any]) -> dict[str, Any]:
+        """Build the queue_snapshot payload for data from the queue_provider callback."""
         depth = data.get("depth", 0)
         age = data.get("oldest_age_seconds")
         summary = f"Queue: {depth} items"
         if age is not None:
             summary += f", oldest {age}s"
-        payload: dict[str, Any] = {
-            "kind": PayloadKind.QUEUE_SNAPSHOT,
+        return {
+            "kind": _PK_QUEUE_SNAPSHOT,
             "summary": summary,
             "data": data,
             "tags": ["queue"],
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
 
     def _stop_heartbeat(self) -> None:
-        """Stop the heartbeat thread."""
-        self._hb_stop.set()
-        if self._hb_thread and self._hb_thread.is_alive():
-            self._hb_thread.join(timeout=2.0)
+        """Unregister from the shared heartbeat scheduler."""
+        _HB_SCHEDULER.unregister(self)
 
     # -- Task lifecycle --
 
@@ -751,14 +958,22 @@ class Agent:
         t._start()
         return t
 
-    def _set_active_task(self, task: Task) -> None:
-        self._task_local.task = task
+    def _set_active_task(self, task: Task) -> contextvars.Token:
+        return self._active_task.set(task)
 
-    def _clear_active_task(self) -> None:
-        self._task_local.task = None
+    def _clear_active_task(self, token: contextvars.Token | None) -> None:
+        # Restores the enclosing task, if any. A manually started task may be
+        # completed from a different context, where the token is not valid.
+        if token is not None:
+            try:
+                self._active_task.reset(token)
+                return
+            except (ValueError, RuntimeError):
+                pass
+        self._active_task.set(None)
 
     def _get_active_task(self) -> Task | None:
-        return getattr(self._task_local, "task", None)
+        return self._active_task.get()
 
     # -- Agent-level events --
 
@@ -783,18 +998,25 @@ class Agent:
         """Decorator for tracking function execution as actions.
 
         Works with both sync and async functions. Supports nesting.
+        Calls not selected by the agent's action_sample_rate run untracked.
         """
 
         def decorator(fn: Callable) -> Callable:
+            # Fixed per decorated function; shared (never mutated) by the
+            # started/completed events of every call
+            base_payload = {
+                "action_name": action_name,
+                "function": f"{fn.__module__}.{fn.__qualname__}",
+            }
             if inspect.iscoroutinefunction(fn):
                 @functools.wraps(fn)
                 async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
-                    return await self._track_async(action_name, fn, args, kwargs)
+                    return await self._track_async(base_payload, fn, args, kwargs)
                 return async_wrapper
             else:
                 @functools.wraps(fn)
                 def sync_wrapper(*args: Any, **kwargs: Any) -> Any:
-                    return self._track_sync(action_name, fn, args, kwargs)
+                    return self._track_sync(base_payload, fn, args, kwargs)
                 return sync_wrapper
 
         return decorator
@@ -805,141 +1027,112 @@ class Agent:
 
     def _track_sync(
         self,
-        action_name: str,
+        base_payload: dict[str, Any],
         fn: Callable,
         args: tuple,
         kwargs: dict,
     ) -> Any:
         """Execute a sync function with action tracking."""
-        action_id = _new_id()
-        parent_action_id = _current_action_id.get()
-        token = _current_action_id.set(action_id)
-
-        task = self._get_active_task()
-        func_name = f"{fn.__module__}.{fn.__qualname__}"
-
-        self._emit_event(
-            event_type=EventType.ACTION_STARTED,
-            action_id=action_id,
-            parent_action_id=parent_action_id,
-            task_id=task.task_id if task else None,
-            project_id=task.project_id if task else None,
-            task_type=task.task_type if task else None,
-            task_run_id=task.task_run_id if task else None,
-            correlation_id=task.correlation_id if task else None,
-            payload={"action_name": action_name, "function": func_name},
-        )
-
-        start = time.monotonic()
+        if self._action_sample_rate < 1.0 and random.random() >= self._action_sample_rate:
+            return fn(*args, **kwargs)
+        action_id, parent_action_id, token, task_fields = self._action_start(base_payload)
+        start_ns = time.monotonic_ns()
         try:
             result = fn(*args, **kwargs)
-            duration_ms = int((time.monotonic() - start) * 1000)
-            self._emit_event(
-                event_type=EventType.ACTION_COMPLETED,
-                action_id=action_id,
-                parent_action_id=parent_action_id,
-                task_id=task.task_id if task else None,
-                project_id=task.project_id if task else None,
-                task_type=task.task_type if task else None,
-                task_run_id=task.task_run_id if task else None,
-                correlation_id=task.correlation_id if task else None,
-                status="success",
-                duration_ms=duration_ms,
-                payload={"action_name": action_name, "function": func_name},
-            )
-            return result
         except Exception as exc:
-            duration_ms = int((time.monotonic() - start) * 1000)
-            self._emit_event(
-                event_type=EventType.ACTION_FAILED,
-                action_id=action_id,
-                parent_action_id=parent_action_id,
-                task_id=task.task_id if task else None,
-                project_id=task.project_id if task else None,
-                task_type=task.task_type if task else None,
-                task_run_id=task.task_run_id if task else None,
-                correlation_id=task.correlation_id if task else None,
-                status="failure",
-                duration_ms=duration_ms,
-                payload={
-                    "action_name": action_name,
-                    "function": func_name,
-                    "exception_type": type(exc).__name__,
-                    "exception_message": str(exc),
-                },
-            )
+            self._action_end(action_id, parent_action_id, base_payload, task_fields, start_ns, exc)
             raise
+        else:
+            self._action_end(action_id, parent_action_id, base_payload, task_fields, start_ns, None)
+            return result
         finally:
-            _current_action_id.reset(token)
+            if token is not None:
+                _current_action_id.reset(token)
 
     async def _track_async(
         self,
-        action_name: str,
+        base_payload: dict[str, Any],
         fn: Callable,
         args: tuple,
         kwargs: dict,
     ) -> Any:
         """Execute an async function with action tracking."""
+        if self._action_sample_rate < 1.0 and random.random() >= self._action_sample_rate:
+            return await fn(*args, **kwargs)
+        action_id, parent_action_id, token, task_fields = self._action_start(base_payload)
+        start_ns = time.monotonic_ns()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as exc:
+            self._action_end(action_id, parent_action_id, base_payload, task_fields, start_ns, exc)
+            raise
+        else:
+            self._action_end(action_id, parent_action_id, base_payload, task_fields, start_ns, None)
+            return result
+        finally:
+            if token is not None:
+                _current_action_id.reset(token)
+
+    def _action_start(
+        self, base_payload: dict[str, Any],
+    ) -> tuple[str, str | None, contextvars.Token | None, dict[str, Any]]:
+        """Open a tracked action and emit its action_started event.
+
+        Shared by @track (sync and async) and track_context().
+
+        Returns (action_id, parent_action_id, token, task_fields); the caller must
+        reset the token (when not None) once the action ends.
+        """
         action_id = _new_id()
-        parent_action_id = _current_action_id.get()
-        token = _current_action_id.set(action_id)
+        if self._track_nesting:
+            parent_action_id = _current_action_id.get()
+            token = _current_action_id.set(action_id)
+        else:
+            parent_action_id = token = None
 
         task = self._get_active_task()
-        func_name = f"{fn.__module__}.{fn.__qualname__}"
-
-        self._emit_event(
-            event_type=EventType.ACTION_STARTED,
+        task_fields = task._task_fields if task else _NO_TASK_FIELDS
+        self._emit_event_with_base(
+            task_fields,
+            event_type=_ET_ACTION_STARTED,
             action_id=action_id,
             parent_action_id=parent_action_id,
-            task_id=task.task_id if task else None,
-            project_id=task.project_id if task else None,
-            task_type=task.task_type if task else None,
-            task_run_id=task.task_run_id if task else None,
-            correlation_id=task.correlation_id if task else None,
-            payload={"action_name": action_name, "function": func_name},
+            payload=base_payload,
         )
+        return action_id, parent_action_id, token, task_fields
 
-        start = time.monotonic()
-        try:
-            result = await fn(*args, **kwargs)
-            duration_ms = int((time.monotonic() - start) * 1000)
-            self._emit_event(
-                event_type=EventType.ACTION_COMPLETED,
-                action_id=action_id,
-                parent_action_id=parent_action_id,
-                task_id=task.task_id if task else None,
-                project_id=task.project_id if task else None,
-                task_type=task.task_type if task else None,
-                task_run_id=task.task_run_id if task else None,
-                correlation_id=task.correlation_id if task else None,
-                status="success",
-                duration_ms=duration_ms,
-                payload={"action_name": action_name, "function": func_name},
-            )
-            return result
-        except Exception as exc:
-            duration_ms = int((time.monotonic() - start) * 1000)
-            self._emit_event(
-                event_type=EventType.ACTION_FAILED,
-                action_id=action_id,
-                parent_action_id=parent_action_id,
-                task_id=task.task_id if task else None,
-                project_id=task.project_id if task else None,
-                task_type=task.task_type if task else None,
-                task_run_id=task.task_run_id if task else None,
-                correlation_id=task.correlation_id if task else None,
-                status="failure",
-                duration_ms=duration_ms,
-                payload={
-                    "action_name": action_name,
-                    "function": func_name,
-                    "exception_type": type(exc).__name__,
-                    "exception_message": str(exc),
-                },
-            )
-            raise
-        finally:
-            _current_action_id.reset(token)
+    def _action_end(
+        self,
+        action_id: str,
+        parent_action_id: str | None,
+        base_payload: dict[str, Any],
+        task_fields: dict[str, Any],
+        start_ns: int,
+        exc: BaseException | None,
+    ) -> None:
+        """Emit action_completed, or action_failed when exc is set."""
+        duration_ms = (time.monotonic_ns() - start_ns) // 1_000_000
+        if exc is None:
+            event_type = _ET_ACTION_COMPLETED
+            status = "success"
+            payload = base_payload
+        else:
+            event_type = _ET_ACTION_FAILED
+            status = "failure"
+            payload = {
+                **base_payload,
+                "exception_type": type(exc).__name__,
+                "exception_message": str(exc),
+            }
+        self._emit_event_with_base(
+            task_fields,
+            event_type=event_type,
+            action_id=action_id,
+            parent_action_id=parent_action_id,
+            status=status,
+            duration_ms=duration_ms,
+            payload=payload,
+        )
 
     # -- Agent-level convenience methods (C1.4) --
 
@@ -975,12 +1168,12 @@ class Agent:
 
         summary = _build_llm_summary(name, model, tokens_in, tokens_out, cost)
         payload: dict[str, Any] = {
-            "kind": PayloadKind.LLM_CALL,
+            "kind": _PK_LLM_CALL,
             "summary": summary,
             "data": data,
             "tags": ["llm"],
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
+        self._emit_event(event_type=_ET_CUSTOM, payload=payload)
 
     def queue_snapshot(
         self,
@@ -1004,12 +1197,12 @@ class Agent:
             summary += f", oldest {oldest_age_seconds}s"
 
         payload: dict[str, Any] = {
-            "kind": PayloadKind.QUEUE_SNAPSHOT,
+            "kind": _PK_QUEUE_SNAPSHOT,
             "summary": summary,
             "data": data,
             "tags": ["queue"],
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
+        self._emit_event(event_type=_ET_CUSTOM, payload=payload)
 
     def todo(
         self,
@@ -1038,12 +1231,12 @@ class Agent:
 
         tags = ["todo", action]
         payload: dict[str, Any] = {
-            "kind": PayloadKind.TODO,
+            "kind": _PK_TODO,
             "summary": summary,
             "data": data,
             "tags": tags,
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
+        self._emit_event(event_type=_ET_CUSTOM, payload=payload)
 
     def scheduled(self, items: list[dict[str, Any]]) -> None:
         """Report scheduled work items."""
@@ -1061,12 +1254,12 @@ class Agent:
             summary += f", next at {time_part}"
 
         payload: dict[str, Any] = {
-            "kind": PayloadKind.SCHEDULED,
+            "kind": _PK_SCHEDULED,
             "summary": summary,
             "data": {"items": items},
             "tags": ["scheduled"],
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
+        self._emit_event(event_type=_ET_CUSTOM, payload=payload)
 
     def report_issue(
         self,
@@ -1096,12 +1289,12 @@ class Agent:
         if category:
             tags.append(category)
         payload: dict[str, Any] = {
-            "kind": PayloadKind.ISSUE,
+            "kind": _PK_ISSUE,
             "summary": summary,
             "data": data,
             "tags": tags,
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
+        self._emit_event(event_type=_ET_CUSTOM, payload=payload)
 
     def resolve_issue(
         self,
@@ -1118,12 +1311,12 @@ class Agent:
             data["issue_id"] = issue_id
 
         payload: dict[str, Any] = {
-            "kind": PayloadKind.ISSUE,
+            "kind": _PK_ISSUE,
             "summary": summary,
             "data": data,
             "tags": ["issue", "resolved"],
         }
-        self._emit_event(event_type=EventType.CUSTOM, payload=payload)
+        self._emit_event(event_type=_ET_CUSTOM, payload=payload)
 
     # -- Event construction (C1.2.8) --
 
@@ -1133,28 +1326,89 @@ class Agent:
         Auto-generates event_id, timestamp. Strips None values.
         Applies severity auto-defaults. Never raises.
         """
-        try:
-            event: dict[str, Any] = {
-                "event_id": _new_id(),
-                "timestamp": _utcnow_iso(),
-            }
-            event.update(kwargs)
-
-            # Apply severity auto-default if not set
-            if event.get("severity") is None:
-                et = event.get("event_type", "")
-                event["severity"] = SEVERITY_DEFAULTS.get(et, Severity.INFO)
-
-            # Client-side field size validation (W1)
-            _validate_field_sizes(event)
+        self._emit_event_with_base(_NO_TASK_FIELDS, **kwargs)
 
-            # Strip None values (but keep required fields)
-            event = _strip_none(event)
+    def _emit_event_with_base(self, base: dict[str, Any], **kwargs: Any) -> None:
+        """Like _emit_event, with base's fields (already free of None) merged in first.
 
-            self._transport.enqueue(event, self._get_envelope())
+        Used for task-scoped events, passing the task's prebuilt identity
+        fields instead of five keyword arguments per event.
+        """
+        self._emit_count += 1
+        try:
+            event = self._build_event(kwargs, base)
+            data = _encode_event(event)
+            if data is not None:
+                self._transport.enqueue(
+                    data,
+                    self._envelope_json,
+                    critical=event["event_type"] in _CRITICAL_EVENT_TYPES,
+                )
         except Exception:
             logger.debug("Failed to emit event", exc_info=True)
 
+    def _emit_events(
+        self, events: list[dict[str, Any]], base: dict[str, Any] = _NO_TASK_FIELDS,
+    ) -> None:
+        """Build several events and enqueue them in one transport call. Never raises."""
+        self._emit_count += 1
+        try:
+            encoded = (_encode_event(self._build_event(kwargs, base)) for kwargs in events)
+            self._transport.enqueue_many(
+                [data for data in encoded if data is not None],
+                self._envelope_json,
+            )
+        except Exception:
+            logger.debug("Failed to emit events", exc_info=True)
+
+    @staticmethod
+    def _build_event(
+        kwargs: dict[str, Any], base: dict[str, Any] = _NO_TASK_FIELDS,
+    ) -> dict[str, Any]:
+        """Build a single event dict from _emit_event keyword arguments.
+
+        Only non-None values are inserted, so no second pass is needed to
+        strip them. event_id, timestamp and event_type are always present.
+        """
+        event_type = kwargs.get("event_type")
+        event: dict[str, Any] = {
+            "event_id": _new_id(),
+            "timestamp": _utcnow_iso(),
+            "event_type": event_type,
+        }
+        event.update(base)
+        for key, value in kwargs.items():
+            if value is not None:
+                event[key] = value
+
+        # Apply severity auto-default if not set
+        if "severity" not in event:
+            event["severity"] = _SEVERITY_DEFAULTS.get(event_type, _SEVERITY_INFO)
+
+        # Client-side field size validation (W1)
+        _validate_field_sizes(event)
+        return event
+
+    @staticmethod
+    def _build_minimal_event(
+        event_type: str, payload: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """Build an event that carries only a type and an optional payload.
+
+        Same result as _build_event for such events, without the generic
+        kwargs walk; used for heartbeats. Only a payload needs validating.
+        """
+        event: dict[str, Any] = {
+            "event_id": _new_id(),
+            "timestamp": _utcnow_iso(),
+            "event_type": event_type,
+            "severity": _SEVERITY_DEFAULTS.get(event_type, _SEVERITY_INFO),
+        }
+        if payload is not None:
+            event["payload"] = payload
+            _validate_field_sizes(event)
+        return event
+
 
 # -- Helpers --
 
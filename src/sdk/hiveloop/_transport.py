@@ -12,13 +12,15 @@ from __future__ import annotations
 
 import atexit
 import collections
-import json
 import logging
+import socket
 import threading
 import time
 from typing import Any
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 
 from shared.enums import MAX_BATCH_EVENTS
 
@@ -29,15 +31,49 @@ _MAX_RETRIES = 5
 _BACKOFF_BASE = 1.0
 _BACKOFF_CAP = 60.0
 
+# Minimum seconds between "queue full" warnings while events are dropped
+_DROP_WARN_INTERVAL = 10.0
+
+
+# Seconds before the first keepalive probe on an idle ingest connection,
+# and between probes after that
+_KEEPALIVE_IDLE = 30
+_KEEPALIVE_INTERVAL = 10
+
+
+# Socket options for the ingest connection. socket_options replaces
+# urllib3's defaults, so those (TCP_NODELAY) are kept. Keepalive probes
+# start after a short idle period so NATs and load balancers don't silently
+# drop the pooled connection between sparse flushes; the kernel default
+# (2 hours on Linux) is far too long for that.
+_SOCKET_OPTIONS = list(HTTPConnection.default_socket_options) + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+if hasattr(socket, "TCP_KEEPIDLE"):
+    _SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, _KEEPALIVE_IDLE))
+if hasattr(socket, "TCP_KEEPINTVL"):
+    _SOCKET_OPTIONS.append(
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, _KEEPALIVE_INTERVAL)
+    )
+
+
+class _IngestAdapter(HTTPAdapter):
+    """HTTPAdapter that applies _SOCKET_OPTIONS to every pooled connection."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        kwargs["socket_options"] = _SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
 
 class _QueueItem:
-    """An event paired with its agent envelope metadata."""
+    """A JSON-encoded event paired with its agent's JSON-encoded envelope."""
 
-    __slots__ = ("event", "envelope")
+    __slots__ = ("event", "envelope", "critical")
 
-    def __init__(self, event: dict[str, Any], envelope: dict[str, Any]) -> None:
+    def __init__(self, event: bytes, envelope: bytes, critical: bool = False) -> None:
         self.event = event
         self.envelope = envelope
+        self.critical = critical
 
 
 class Transport:
@@ -59,12 +95,27 @@ class Transport:
         self._api_key = api_key
         self._flush_interval = flush_interval
         self._batch_size = min(batch_size, MAX_BATCH_EVENTS)
+        self._max_queue_size = max_queue_size
         self._shutdown = False
 
-        # Thread-safe bounded queue — oldest events dropped when full
-        self._queue: collections.deque[_QueueItem] = collections.deque(
-            maxlen=max_queue_size
-        )
+        # FIFO event queue, bounded to max_queue_size by _evict_overflow
+        # (oldest events dropped when full)
+        self._queue: collections.deque[_QueueItem] = collections.deque()
+        # Critical events evicted from the head of a full queue. They are
+        # older than everything still queued, so draining them first keeps
+        # FIFO order
+        self._spilled: collections.deque[_QueueItem] = collections.deque()
+        # Envelope -> agent_id for agents that report drops in their
+        # heartbeat (see track_drops)
+        self._drop_owners: dict[bytes, str] = {}
+        # Events dropped per agent_id since that agent's last
+        # pop_dropped_count()
+        self._dropped: dict[str, int] = {}
+        # Events dropped since the last queue-full warning
+        self._unwarned_drops = 0
+        self._last_drop_warning = 0.0
+        # Serializes draining and eviction (flush thread vs. final shutdown
+        # drain vs. producers that overfilled the queue)
         self._lock = threading.Lock()
 
         # Signal to wake the flush thread early
@@ -72,6 +123,9 @@ class Transport:
 
         # HTTP session (reused for connection pooling)
         self._session = requests.Session()
+        adapter = _IngestAdapter()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
         self._session.headers.update(
             {
                 "Authorization": f"Bearer {api_key}",
@@ -92,26 +146,68 @@ class Transport:
     # Public API
     # ------------------------------------------------------------------
 
-    def enqueue(self, event: dict[str, Any], envelope: dict[str, Any]) -> None:
-        """Add an event to the queue. Non-blocking, never raises."""
+    def enqueue(
+        self,
+        event: bytes,
+        envelope: bytes,
+        critical: bool = False,
+    ) -> None:
+        """Add an event to the queue. Non-blocking, never raises.
+
+        event and envelope arrive already encoded as compact JSON objects
+        (the agent serializes on the producer side), so batches are built
+        by concatenation.
+
+        deque.append is atomic, so producers only take the transport lock
+        when the queue is over capacity. Critical events are never evicted
+        and trigger an immediate flush.
+        """
         if self._shutdown:
             return
         try:
-            prev_len = len(self._queue)
-            with self._lock:
-                self._queue.append(_QueueItem(event, envelope))
-            # Log if we hit capacity (deque silently drops oldest)
-            if prev_len >= (self._queue.maxlen or 0):
-                logger.warning(
-                    "Event queue full (%d). Oldest events are being dropped.",
-                    self._queue.maxlen,
-                )
+            queue = self._queue
+            queue.append(_QueueItem(event, envelope, critical))
+            queued = len(queue)
+            if queued > self._max_queue_size:
+                self._evict_overflow()
             # Trigger flush if we've accumulated enough events
-            if len(self._queue) >= self._batch_size:
+            if critical or queued >= self._batch_size:
                 self._flush_event.set()
         except Exception:
             logger.debug("Failed to enqueue event", exc_info=True)
 
+    def enqueue_many(self, events: list[bytes], envelope: bytes) -> None:
+        """Add several events sharing one envelope in one deque operation. Never raises."""
+        if self._shutdown or not events:
+            return
+        try:
+            items = [_QueueItem(event, envelope) for event in events]
+            queue = self._queue
+            queue.extend(items)
+            queued = len(queue)
+            if queued > self._max_queue_size:
+                self._evict_overflow()
+            if queued >= self._batch_size:
+                self._flush_event.set()
+        except Exception:
+            logger.debug("Failed to enqueue events", exc_info=True)
+
+    def track_drops(self, envelope: bytes, agent_id: str) -> None:
+        """Count dropped events with this envelope for agent_id.
+
+        Called again when the agent's envelope changes; the old envelope
+        keeps mapping to the same agent so its still-queued events count.
+        """
+        with self._lock:
+            self._drop_owners[envelope] = agent_id
+
+    def pop_dropped_count(self, agent_id: str) -> int:
+        """Return how many of this agent's events were dropped since the last call, and reset it."""
+        if agent_id not in self._dropped:
+            return 0
+        with self._lock:
+            return self._dropped.pop(agent_id, 0)
+
     def flush(self) -> None:
         """Trigger an immediate flush. Blocks until the flush cycle completes."""
         if self._shutdown:
@@ -161,16 +257,15 @@ class Transport:
                 break
             batches = self._group_by_agent(items)
             for envelope, events in batches.items():
-                self._send_batch(json.loads(envelope), events)
+                self._send_batch(envelope, events)
 
     def _drain_batch(self) -> list[_QueueItem]:
         """Pop up to batch_size items from the queue."""
         items: list[_QueueItem] = []
         with self._lock:
-            for _ in range(self._batch_size):
-                if not self._queue:
-                    break
-                items.append(self._queue.popleft())
+            for queue in (self._spilled, self._queue):
+                while queue and len(items) < self._batch_size:
+                    items.append(queue.popleft())
         return items
 
     # ------------------------------------------------------------------
@@ -179,31 +274,36 @@ class Transport:
 
     def _group_by_agent(
         self, items: list[_QueueItem]
-    ) -> dict[str, list[dict[str, Any]]]:
-        """Group events by agent envelope (serialized as JSON key)."""
-        groups: dict[str, list[dict[str, Any]]] = {}
+    ) -> dict[bytes, list[bytes]]:
+        """Group events by their agent's encoded envelope."""
+        groups: dict[bytes, list[bytes]] = {}
         for item in items:
-            key = json.dumps(item.envelope, sort_keys=True)
-            groups.setdefault(key, []).append(item.event)
+            events = groups.get(item.envelope)
+            if events is None:
+                groups[item.envelope] = [item.event]
+            else:
+                events.append(item.event)
         return groups
 
     # ------------------------------------------------------------------
     # HTTP send with retry
     # ------------------------------------------------------------------
 
-    def _send_batch(
-        self, envelope: dict[str, Any], events: list[dict[str, Any]]
-    ) -> bool:
+    def _send_batch(self, envelope: bytes, events: list[bytes]) -> bool:
         """POST a batch to /v1/ingest with retry and backoff.
 
         Returns True on success, False on permanent failure.
         """
         url = f"{self._endpoint}/v1/ingest"
-        body = {"envelope": envelope, "events": events}
+        # Envelope and events are pre-encoded JSON; the body is just their
+        # concatenation, and retries resend the same bytes
+        body = b"".join((
+            b'{"envelope":', envelope, b',"events":[', b",".join(events), b"]}",
+        ))
 
         for attempt in range(_MAX_RETRIES + 1):
             try:
-                resp = self._session.post(url, json=body, timeout=30)
+                resp = self._session.post(url, data=body, timeout=30)
 
                 if resp.status_code in (200, 207):
                     # Log any rejected events from partial success
@@ -284,6 +384,46 @@ class Transport:
     # Helpers
     # ------------------------------------------------------------------
 
+    def _evict_overflow(self) -> None:
+        """Trim the queue back to max_queue_size, oldest first.
+
+        Evicted critical events are moved aside, in order, instead of being
+        dropped; they are only dropped if the spill-over itself fills up.
+        """
+        unwarned = 0
+        with self._lock:
+            queue = self._queue
+            spilled = self._spilled
+            owners = self._drop_owners
+            dropped = self._dropped
+            lost = 0
+            while len(queue) > self._max_queue_size:
+                item = queue.popleft()
+                if item.critical:
+                    spilled.append(item)
+                    if len(spilled) <= self._max_queue_size:
+                        continue
+                    item = spilled.popleft()
+                agent_id = owners.get(item.envelope)
+                if agent_id is not None:
+                    dropped[agent_id] = dropped.get(agent_id, 0) + 1
+                lost += 1
+            self._unwarned_drops += lost
+            now = time.monotonic()
+            if lost and now - self._last_drop_warning >= _DROP_WARN_INTERVAL:
+                self._last_drop_warning = now
+                unwarned = self._unwarned_drops
+                self._unwarned_drops = 0
+        # Logged outside the lock: a log handler that reports to HiveBoard
+        # enqueues again and may land back here
+        if unwarned:
+            logger.warning(
+                "Event queue full (%d). Oldest events are being dropped "
+                "(%d dropped since the last warning).",
+                self._max_queue_size,
+                unwarned,
+            )
+
     @staticmethod
     def _backoff_delay(attempt: int) -> float:
         """Exponential backoff: 1s, 2s, 4s, 8s, 16s — capped at 60s."""